@@ -1,28 +1,41 @@
 # app_crystal.py
 from typing import Optional
 from decimal import Decimal
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
-from supabase_client import supabase_as
+from supabase_client import supabase_as_async
+from auth_cache import get_user_cached
+import response_cache
 
 router = APIRouter(prefix="/crystals", tags=["crystals"])
 auth_scheme = HTTPBearer(auto_error=True)
 
 # ===== Auth helper =====
-def get_current_user(creds: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+def get_current_user(request: Request, creds: HTTPAuthorizationCredentials = Depends(auth_scheme)):
     """
-    Authorization: Bearer <access_token> を受け取り、
-    Supabaseのユーザー情報を取得。失敗時は401。
+    Authorization: Bearer <access_token> を受け取り、ユーザー情報を取得。
+    ミドルウェアで検証済みならそれを再利用。失敗時は401。
     """
-    try:
-        db = supabase_as(creds.credentials)
-        resp = db.auth.get_user(creds.credentials)
-        if not resp or not getattr(resp, "user", None):
-            raise HTTPException(status_code=401, detail="Unauthenticated")
-        return resp.user
-    except Exception:
+    user = getattr(request.state, "user", None) or get_user_cached(creds.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return user
+
+def get_current_user_id(request: Request, creds: HTTPAuthorizationCredentials = Depends(auth_scheme)) -> str:
+    """user.id しか使わないエンドポイント向けの軽量版（sub クレームを直接返す）"""
+    user = getattr(request.state, "user", None) or get_user_cached(creds.credentials)
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return user.id
+
+async def get_db(creds: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+    """
+    リクエストのトークンでスコープしたクライアントを返す依存関係。
+    FastAPIの依存関係キャッシュにより同一リクエスト内では1度しか解決されないので、
+    ハンドラ本体・ヘルパーは常に同じクライアントを共有する。
+    """
+    return await supabase_as_async(creds.credentials)
 
 # ===== DTO =====
 class CreateCrystalPayload(BaseModel):
@@ -35,6 +48,11 @@ class CrystalRecordCreate(BaseModel):
     value: Decimal = Field(..., max_digits=12, decimal_places=4)
     note: Optional[str] = None
 
+    @property
+    def value_str(self) -> str:
+        """Supabaseへ渡すnumericの文字列形（呼び出し側で都度 str() し直さない）"""
+        return format(self.value, "f")
+
 class CrystalSummary(BaseModel):
     crystal_id: int
     title: str
@@ -51,22 +69,28 @@ class CrystalWithRoom(BaseModel):
     target_value: Decimal
     unit: str
 
+# ===== Column projections =====
+# select句の文字列をリクエスト毎に組み立て直さないよう定数化
+_CRYSTAL_COLS = "crystal_id,room_id,title,target_value,unit"
+_CRYSTAL_WITH_ROOM_COLS = _CRYSTAL_COLS + ",rooms(name)"
+_RECORD_VALUE_COL = "value"
+
 # ===== Utils =====
-def _fetch_crystal_by_room(room_id: int, token: str):
+# 各ヘルパーはエンドポイント側で一度だけ作ったクライアントを受け取る
+# （リクエスト内で supabase_as を何度も呼び直さない）
+async def _fetch_crystal_by_room(db, room_id: int):
     """ルームに紐づく結晶を1件取得（MVP: 1ルーム1結晶想定）"""
-    db = supabase_as(token)
     try:
-        res = db.table("crystals").select("*").eq("room_id", room_id).limit(1).execute()
+        res = await db.table("crystals").select(_CRYSTAL_COLS).eq("room_id", room_id).limit(1).execute()
         rows = res.data or []
         return rows[0] if rows else None
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error (crystals by room): {e}")
 
-def _fetch_crystal(crystal_id: int, token: str):
+async def _fetch_crystal(db, crystal_id: int):
     """crystal_idで結晶を取得（RLSにより見えなければ404相当）"""
-    db = supabase_as(token)
     try:
-        res = db.table("crystals").select("*").eq("crystal_id", crystal_id).limit(1).execute()
+        res = await db.table("crystals").select(_CRYSTAL_COLS).eq("crystal_id", crystal_id).limit(1).execute()
         rows = res.data or []
         if not rows:
             raise HTTPException(status_code=404, detail="crystal not found")
@@ -76,43 +100,114 @@ def _fetch_crystal(crystal_id: int, token: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error (crystal fetch): {e}")
 
-def _fetch_room_name(room_id: int, token: str) -> Optional[str]:
+async def _fetch_room_name(db, room_id: int) -> Optional[str]:
     """rooms.name を取得"""
-    db = supabase_as(token)
     try:
-        res = db.table("rooms").select("name").eq("id", room_id).limit(1).execute()
+        res = await db.table("rooms").select("name").eq("id", room_id).limit(1).execute()
         rows = res.data or []
         return rows[0]["name"] if rows else None
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error (rooms name): {e}")
 
-def _sum_records(crystal_id: int, token: str) -> Decimal:
-    """記録の合計値を計算（必要に応じてRPC化を検討）"""
-    db = supabase_as(token)
+async def _add_record_with_summary(db, crystal_id: int, value_str: str, note: Optional[str]):
+    """
+    INSERT＋SUM＋crystal取得をDB関数 add_crystal_record で1往復にまとめる。
+    （user_id は関数側で auth.uid() から解決）
+    関数が未デプロイの環境では None を返し、呼び出し側が従来経路にフォールバック。
+    期待する戻り値: record(jsonb), crystal_id, title, target_value, unit, total_value
+    """
     try:
-        res = db.table("crystal_records").select("value").eq("crystal_id", crystal_id).execute()
-        total = Decimal("0")
-        for row in (res.data or []):
-            total += Decimal(str(row["value"]))
-        return total
+        res = await db.rpc(
+            "add_crystal_record",
+            {
+                "p_crystal_id": crystal_id,
+                "p_value": value_str,
+                "p_note": note,
+            },
+        ).execute()
+        rows = res.data or []
+        return rows[0] if rows else None
+    except Exception:
+        return None
+
+async def _summary_via_rpc(db, params: dict):
+    """
+    crystal本体＋SUM(value)を1往復で取得するDB関数を呼ぶ。
+    params: {"p_crystal_id": id}（crystal_summary）
+            {"p_room_id": id}  （crystal_summary_by_room）
+    未デプロイ環境では None（呼び出し側がフォールバック）。
+    """
+    fn = "crystal_summary" if "p_crystal_id" in params else "crystal_summary_by_room"
+    try:
+        res = await db.rpc(fn, params).execute()
+        rows = res.data or []
+        return rows[0] if rows else None
+    except Exception:
+        return None
+
+async def _fetch_crystal_with_total(db, col: str, value: int):
+    """
+    ビュー crystal_with_total（crystals に SUM(value) を LEFT JOIN で付けた集計）を
+    1行だけ読む。crystal行と合計が1往復・1スキャンで揃う。
+    未作成の環境では None（呼び出し側が従来の2クエリにフォールバック）。
+    """
+    try:
+        res = await (
+            db.table("crystal_with_total")
+            .select("*")
+            .eq(col, value)
+            .limit(1)
+            .execute()
+        )
+        rows = res.data or []
+        return rows[0] if rows else None
+    except Exception:
+        return None
+
+async def _sum_records(db, crystal_id: int) -> Decimal:
+    """
+    記録の合計値を取得。
+    まずDB側のビュー crystal_totals（SUM(value) を GROUP BY crystal_id した集計）を
+    1行だけ読む。全レコードを転送してPythonで足すより転送量・アロケーションともに小さい。
+    ビューが無い環境では従来どおり全行を取得して合計。
+    """
+    try:
+        res = await (
+            db.table("crystal_totals")
+            .select("total")
+            .eq("crystal_id", crystal_id)
+            .limit(1)
+            .execute()
+        )
+        rows = res.data or []
+        # 記録0件はビューに行が無いだけなので 0 扱い
+        return Decimal(str(rows[0]["total"])) if rows else Decimal("0")
+    except Exception:
+        pass  # ビュー未作成の環境はフォールバック
+
+    try:
+        res = await db.table("crystal_records").select(_RECORD_VALUE_COL).eq("crystal_id", crystal_id).execute()
+        # numericは文字列で返るのでそのままDecimalへ（str()の再ラップは不要）
+        return sum(
+            (Decimal(r["value"]) if isinstance(r["value"], str) else Decimal(str(r["value"]))
+             for r in (res.data or [])),
+            Decimal("0"),
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error (records sum): {e}")
 
 # ===== Endpoints =====
 @router.post("", summary="結晶を作成（1ルーム1個想定）")
-def create_crystal(
+async def create_crystal(
     payload: CreateCrystalPayload,
-    creds: HTTPAuthorizationCredentials = Depends(auth_scheme),
-    user=Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    db=Depends(get_db),
 ):
-    db = supabase_as(creds.credentials)
-
-    existing = _fetch_crystal_by_room(payload.room_id, creds.credentials)
-    if existing:
-        raise HTTPException(status_code=409, detail="crystal already exists for this room")
 
+    # 重複チェックは事前SELECTではなく UNIQUE(room_id) 制約に任せる
+    # （成功パスが1往復で済む。違反は 23505 → 409 に変換）
     try:
-        res = (
+        res = await (
             db.table("crystals")
             .insert(
                 {
@@ -129,7 +224,7 @@ def create_crystal(
 
         # フォールバック：返らない環境向けに room_id で取り直し
         if not row:
-            ref = (
+            ref = await (
                 db.table("crystals")
                 .select("*")
                 .eq("room_id", payload.room_id)
@@ -145,23 +240,54 @@ def create_crystal(
     except HTTPException:
         raise
     except Exception as e:
+        if getattr(e, "code", None) == "23505":
+            raise HTTPException(status_code=409, detail="crystal already exists for this room")
         raise HTTPException(status_code=500, detail=f"DB error (crystal insert): {e}")
 
 @router.get("/by-room/{room_id}", response_model=CrystalWithRoom, summary="ルームの結晶を取得（room_name付き）")
-def get_crystal_by_room(
+async def get_crystal_by_room(
     room_id: int,
-    creds: HTTPAuthorizationCredentials = Depends(auth_scheme),
-    user=Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    db=Depends(get_db),
 ):
-    crystal = _fetch_crystal_by_room(room_id, creds.credentials)
+    cache_key = f"crystal-by-room:{room_id}"
+    cached = response_cache.get(user_id, cache_key)
+    if cached is not None:
+        return cached
+
+    # crystals と rooms.name を埋め込みselectで1往復取得（FK: crystals.room_id → rooms.id）
+    crystal = None
+    room_name = None
+    try:
+        res = await (
+            db.table("crystals")
+            .select(_CRYSTAL_WITH_ROOM_COLS)
+            .eq("room_id", room_id)
+            .limit(1)
+            .execute()
+        )
+        rows = res.data or []
+        if rows:
+            crystal = rows[0]
+            room = crystal.get("rooms") or {}
+            if isinstance(room, list):
+                room = room[0] if room else {}
+            room_name = room.get("name")
+    except Exception:
+        crystal = None  # 埋め込み不可の環境は従来の2往復にフォールバック
+
+    if crystal is None:
+        crystal = await _fetch_crystal_by_room(db, room_id)
+        if not crystal:
+            raise HTTPException(status_code=404, detail="crystal not found")
+        room_name = await _fetch_room_name(db, room_id)
+
     if not crystal:
         raise HTTPException(status_code=404, detail="crystal not found")
-
-    room_name = _fetch_room_name(room_id, creds.credentials)
     if not room_name:
         raise HTTPException(status_code=404, detail="room not found or inaccessible")
 
-    return CrystalWithRoom(
+    result = CrystalWithRoom(
         crystal_id=crystal["crystal_id"],
         room_id=room_id,
         room_name=room_name,
@@ -169,41 +295,43 @@ def get_crystal_by_room(
         target_value=Decimal(str(crystal["target_value"])),
         unit=crystal["unit"],
     )
+    response_cache.put(user_id, cache_key, result)
+    return result
 
 @router.post("/{crystal_id}/records", summary="進捗を追加（crystal_id 指定）")
-def add_record(
+async def add_record(
     crystal_id: int,
     payload: CrystalRecordCreate,
-    creds: HTTPAuthorizationCredentials = Depends(auth_scheme),
-    user=Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    db=Depends(get_db),
 ):
-    db = supabase_as(creds.credentials)
     try:
-        # 存在/権限チェック
-        crystal = _fetch_crystal(crystal_id, creds.credentials)
-
-        ins = (
-            db.table("crystal_records")
-            .insert(
-                {
-                    "crystal_id": crystal_id,
-                    "user_id": user.id,
-                    "value": str(payload.value),
-                    "note": payload.note or None,
-                },
-                returning="representation",  # ★ ここで返す
-            )
-            .execute()
+        # 事前の存在チェックはしない：不可視/不存在の親はINSERT自体が
+        # FK違反(23503)やRLSで落ちるので、そのエラーを404に読み替える
+        builder = db.table("crystal_records").insert(
+            {
+                "crystal_id": crystal_id,
+                "user_id": user_id,
+                "value": payload.value_str,
+                "note": payload.note or None,
+            },
+            returning="representation",  # ★ ここで返す
         )
+        try:
+            # 挿入行と同時に親のtarget_valueも埋め込みで返してもらう（%計算まで1往復）
+            builder.params = builder.params.set("select", "*,crystals(target_value)")
+        except Exception:
+            pass
+        ins = await builder.execute()
         row = (ins.data or [None])[0]
 
-        # フォールバック：直近の自分の記録で代替
+        # フォールバック：直近の自分の記録で代替（こちらも親のtarget_valueを同時に取得）
         if not row:
-            ref = (
+            ref = await (
                 db.table("crystal_records")
-                .select("*")
+                .select("*, crystals(target_value)")
                 .eq("crystal_id", crystal_id)
-                .eq("user_id", user.id)
+                .eq("user_id", user_id)
                 .order("created_at", desc=True)
                 .limit(1)
                 .execute()
@@ -213,42 +341,96 @@ def add_record(
         if not row:
             raise HTTPException(status_code=400, detail="insert record failed")
 
+        # 埋め込みが返ればそこから、返らない環境では従来どおり取り直し
+        target = None
+        embedded = row.get("crystals")
+        if isinstance(embedded, list):
+            embedded = embedded[0] if embedded else None
+        if embedded:
+            target = Decimal(str(embedded["target_value"]))
+        if target is None:
+            crystal = await _fetch_crystal(db, crystal_id)
+            target = Decimal(str(crystal["target_value"]))
+
         # 単回の記録値に対する%を返す仕様（既存フロント互換）
         value = Decimal(str(row["value"]))
-        target = Decimal(str(crystal["target_value"]))
         percent = int((value / target * 100)) if target > 0 else 0
         # 0〜100にクリップ（必要なら）
         percent = max(0, min(100, percent))
+        response_cache.invalidate(user_id)
         return percent
     except HTTPException:
         raise
     except Exception as e:
+        if getattr(e, "code", None) in ("23503", "42501"):  # FK違反 / RLS拒否
+            raise HTTPException(status_code=404, detail="crystal not found")
         raise HTTPException(status_code=500, detail=f"Failed to add record: {e}")
     
 @router.post("/by-room/{room_id}/records", summary="進捗を追加（room_id 指定）")
-def add_record_by_room(
+async def add_record_by_room(
     room_id: int,
     payload: CrystalRecordCreate,
-    creds: HTTPAuthorizationCredentials = Depends(auth_scheme),
-    user=Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    db=Depends(get_db),
 ):
-    db = supabase_as(creds.credentials)
+
+    # 0) 最短経路：DB関数 progress_tick が crystal解決→INSERT→SUM→summary構築まで
+    #    丸ごと行い、レスポンスと同形の jsonb を返す（SECURITY INVOKER / RLS有効）。
+    #    未デプロイの環境では下の段階的な経路にフォールバック。
+    try:
+        res = await db.rpc(
+            "progress_tick",
+            {
+                "p_room_id": room_id,
+                "p_value": payload.value_str,
+                "p_note": payload.note,
+            },
+        ).execute()
+        data = res.data
+        if isinstance(data, list):
+            data = data[0] if data else None
+        if data:
+            response_cache.invalidate(user_id)
+            return data
+    except Exception:
+        pass
 
     # 1) room_id → crystal を取得（RLSでメンバー以外は不可視）
-    crystal = _fetch_crystal_by_room(room_id, creds.credentials)
+    crystal = await _fetch_crystal_by_room(db, room_id)
     if not crystal:
         raise HTTPException(status_code=404, detail="crystal not found for this room")
     crystal_id = crystal["crystal_id"]
 
+    # 1.5) まずはDB関数で INSERT＋SUM を1往復に（未デプロイならNone）
+    folded = await _add_record_with_summary(db, crystal_id, payload.value_str, payload.note)
+    if folded:
+        total = Decimal(str(folded["total_value"]))
+        target = Decimal(str(folded["target_value"]))
+        # 比率はfloat同士で割る（Decimal除算より軽く、結果はどのみちfloat）
+        target_f = float(target)
+        rate = (float(total) / target_f) if target_f > 0 else 0.0
+        response_cache.invalidate(user_id)
+        return {
+            "record": folded["record"],
+            "summary": {
+                "crystal_id": crystal_id,
+                "title": folded["title"],
+                "target_value": target,
+                "unit": folded["unit"],
+                "total_value": total,
+                "progress_rate": min(rate, 1.0),
+            },
+        }
+
     try:
-        # 2) 記録を追加（user_id は JWT から）★ .select() を使わない
-        ins = (
+        # 2) フォールバック：記録を追加（user_id は JWT から）★ .select() を使わない
+        ins = await (
             db.table("crystal_records")
             .insert(
                 {
                     "crystal_id": crystal_id,
-                    "user_id": user.id,
-                    "value": str(payload.value),
+                    "user_id": user_id,
+                    "value": payload.value_str,
                     "note": payload.note or None,
                 },
                 returning="representation",  # ★ 挿入行を返却
@@ -259,7 +441,7 @@ def add_record_by_room(
 
         # フォールバック：返らない環境向けに直近1件を再取得
         if not record:
-            ref = (
+            ref = await (
                 db.table("crystal_records")
                 .select("*")
                 .eq("crystal_id", crystal_id)
@@ -273,11 +455,13 @@ def add_record_by_room(
             raise HTTPException(status_code=400, detail="insert record failed")
 
         # 3) 合計値計算 → progress_rate
-        total = _sum_records(crystal_id, creds.credentials)
+        total = await _sum_records(db, crystal_id)
         target = Decimal(str(crystal["target_value"]))
-        rate = float(total / target) if target > 0 else 0.0
+        target_f = float(target)
+        rate = (float(total) / target_f) if target_f > 0 else 0.0
         rate = min(rate, 1.0)
 
+        response_cache.invalidate(user_id)
         return {
             "record": record,
             "summary": {
@@ -295,16 +479,58 @@ def add_record_by_room(
         raise HTTPException(status_code=500, detail=f"Failed to add record (by room): {e}")
 
 @router.get("/{crystal_id}/summary", response_model=CrystalSummary, summary="結晶サマリーを取得（crystal_id 指定）")
-def get_summary(
+async def get_summary(
     crystal_id: int,
-    creds: HTTPAuthorizationCredentials = Depends(auth_scheme),
-    user=Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    db=Depends(get_db),
 ):
-    crystal = _fetch_crystal(crystal_id, creds.credentials)
-    total = _sum_records(crystal_id, creds.credentials)
+    cache_key = f"summary:{crystal_id}"
+    cached = response_cache.get(user_id, cache_key)
+    if cached is not None:
+        return cached
+
+    # まずはDB関数で crystal＋SUM を1往復に（未デプロイならNone）
+    row = await _summary_via_rpc(db, {"p_crystal_id": crystal_id})
+    if row:
+        total = Decimal(str(row["total_value"]))
+        target = Decimal(str(row["target_value"]))
+        target_f = float(target)
+        rate = (float(total) / target_f) if target_f > 0 else 0.0
+        summary = CrystalSummary(
+            crystal_id=row["crystal_id"],
+            title=row["title"],
+            target_value=target,
+            unit=row["unit"],
+            total_value=total,
+            progress_rate=min(rate, 1.0),
+        )
+        response_cache.put(user_id, cache_key, summary)
+        return summary
+
+    # 次善：ビューで crystal＋合計を1往復（未作成ならさらにフォールバック）
+    joined = await _fetch_crystal_with_total(db, "crystal_id", crystal_id)
+    if joined:
+        total = Decimal(str(joined["total"]))
+        target = Decimal(str(joined["target_value"]))
+        target_f = float(target)
+        rate = (float(total) / target_f) if target_f > 0 else 0.0
+        summary = CrystalSummary(
+            crystal_id=joined["crystal_id"],
+            title=joined["title"],
+            target_value=target,
+            unit=joined["unit"],
+            total_value=total,
+            progress_rate=min(rate, 1.0),
+        )
+        response_cache.put(user_id, cache_key, summary)
+        return summary
+
+    crystal = await _fetch_crystal(db, crystal_id)
+    total = await _sum_records(db, crystal_id)
     target = Decimal(str(crystal["target_value"]))
-    rate = float(total / target) if target > 0 else 0.0
-    return CrystalSummary(
+    target_f = float(target)
+    rate = (float(total) / target_f) if target_f > 0 else 0.0
+    summary = CrystalSummary(
         crystal_id=crystal["crystal_id"],
         title=crystal["title"],
         target_value=target,
@@ -312,23 +538,67 @@ def get_summary(
         total_value=total,
         progress_rate=min(rate, 1.0),
     )
+    response_cache.put(user_id, cache_key, summary)
+    return summary
 
 @router.get("/by-room/{room_id}/summary", summary="結晶サマリーを取得（room_id 指定）")
-def get_summary_by_room(
+async def get_summary_by_room(
     room_id: int,
-    creds: HTTPAuthorizationCredentials = Depends(auth_scheme),
-    user=Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    db=Depends(get_db),
 ):
-    crystal = _fetch_crystal_by_room(room_id, creds.credentials)
+    cache_key = f"summary-by-room:{room_id}"
+    cached = response_cache.get(user_id, cache_key)
+    if cached is not None:
+        return cached
+
+    # まずはDB関数で crystal＋SUM を1往復に（未デプロイならNone）
+    row = await _summary_via_rpc(db, {"p_room_id": room_id})
+    if row:
+        total = Decimal(str(row["total_value"]))
+        target = Decimal(str(row["target_value"]))
+        target_f = float(target)
+        rate = (float(total) / target_f) if target_f > 0 else 0.0
+        summary = {
+            "crystal_id": row["crystal_id"],
+            "title": row["title"],
+            "target_value": target,
+            "unit": row["unit"],
+            "total_value": total,
+            "progress_rate": min(rate, 1.0),
+        }
+        response_cache.put(user_id, cache_key, summary)
+        return summary
+
+    # 次善：ビューで crystal＋合計を1往復（未作成ならさらにフォールバック）
+    joined = await _fetch_crystal_with_total(db, "room_id", room_id)
+    if joined:
+        total = Decimal(str(joined["total"]))
+        target = Decimal(str(joined["target_value"]))
+        target_f = float(target)
+        rate = (float(total) / target_f) if target_f > 0 else 0.0
+        summary = {
+            "crystal_id": joined["crystal_id"],
+            "title": joined["title"],
+            "target_value": target,
+            "unit": joined["unit"],
+            "total_value": total,
+            "progress_rate": min(rate, 1.0),
+        }
+        response_cache.put(user_id, cache_key, summary)
+        return summary
+
+    crystal = await _fetch_crystal_by_room(db, room_id)
     if not crystal:
         raise HTTPException(status_code=404, detail="crystal not found for this room")
 
     crystal_id = crystal["crystal_id"]
-    total = _sum_records(crystal_id, creds.credentials)
+    total = await _sum_records(db, crystal_id)
     target = Decimal(str(crystal["target_value"]))
-    rate = float(total / target) if target > 0 else 0.0
+    target_f = float(target)
+    rate = (float(total) / target_f) if target_f > 0 else 0.0
 
-    return {
+    summary = {
         "crystal_id": crystal_id,
         "title": crystal["title"],
         "target_value": target,
@@ -336,20 +606,19 @@ def get_summary_by_room(
         "total_value": total,
         "progress_rate": min(rate, 1.0),
     }
+    response_cache.put(user_id, cache_key, summary)
+    return summary
 
 @router.get("/{crystal_id}/records", summary="記録一覧（新しい順）")
-def list_records(
+async def list_records(
     crystal_id: int,
     limit: int = 50,
-    creds: HTTPAuthorizationCredentials = Depends(auth_scheme),
-    user=Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    db=Depends(get_db),
 ):
-    db = supabase_as(creds.credentials)
-    # 権限/存在チェック（RLSで見えなければ404相当）
-    _ = _fetch_crystal(crystal_id, creds.credentials)
-
+    # 事前の存在チェックはしない：RLSで不可視なら本クエリが素直に空を返す
     try:
-        res = (
+        res = await (
             db.table("crystal_records")
             .select("*")
             .eq("crystal_id", crystal_id)
@@ -1,13 +1,17 @@
 # app_profile.py
 from typing import Optional, Dict, Any
 
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
 from pydantic import BaseModel, Field
-from supabase_client import supabase
+from supabase_client import get_supabase_async
+from auth_cache import get_user_cached
+import response_cache
 
 router = APIRouter(prefix="/me", tags=["me"])
 
 USERS_TABLE = "users"
+# select句を毎回組み立てないよう定数化
+PROFILE_COLS = "user_id, display_name, avatar_url, solo_count, team_count, badge_count"
 
 
 # ====== Schemas ======
@@ -25,24 +29,27 @@ class ProfileUpdate(BaseModel):
 
 
 # ====== Auth ======
-def get_user_id_from_bearer(authorization: str = Header(...)) -> str:
+def get_user_from_bearer(request: Request, authorization: str = Header(...)):
     """
-    Authorization: Bearer <access_token> からSupabaseユーザーを取得して user_id を返す。
+    Authorization: Bearer <access_token> からSupabaseユーザーを取得。
+    （ミドルウェア検証済みなら再利用。JWTローカル検証＋キャッシュ。user_metadata も含む）
     """
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return user
+
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid Authorization header")
 
     access_token = authorization.removeprefix("Bearer ").strip()
-    try:
-        resp = supabase.auth.get_user(access_token)
-    except Exception:
-        # SDK通信エラーなどは401で返す
+    user = get_user_cached(access_token)
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = getattr(resp, "user", None)
-    if not user or not getattr(user, "id", None):
-        raise HTTPException(status_code=401, detail="Invalid token")
+    return user
 
+
+def get_user_id_from_bearer(user=Depends(get_user_from_bearer)) -> str:
     return user.id
 
 
@@ -69,58 +76,62 @@ def _default_profile_payload(display_name: str = "User") -> Dict[str, Any]:
 
 # ====== Routes ======
 @router.get("/profile", response_model=ProfileOut)
-def get_my_profile(user_id: str = Depends(get_user_id_from_bearer)):
+async def get_my_profile(user=Depends(get_user_from_bearer)):
     """
     プロフィールを取得。存在しなければデフォルト値で自動作成して返す（フロントが404処理不要）。
+    取得と初回作成はDB関数 get_or_create_profile（UPSERT＋RETURNING）で1往復。
+    初期表示名はキャッシュ済みJWTの user_metadata から取るのでGoTrueへの再問い合わせも不要。
     """
-    # rows取得（single()は0件でPGRST116になるのでlimit(1)）
-    res = (
-        supabase.table(USERS_TABLE)
-        .select("user_id, display_name, avatar_url, solo_count, team_count, badge_count")
+    user_id = user.id
+    cached = response_cache.get(user_id, "profile")
+    if cached is not None:
+        return cached
+
+    initial_name = (user.user_metadata or {}).get("name") or "User"
+    db = await get_supabase_async()
+
+    # まずはDB関数で get-or-create を1往復に（未デプロイならNone）
+    try:
+        res = await db.rpc(
+            "get_or_create_profile", {"_uid": user_id, "_name": initial_name}
+        ).execute()
+        rows = res.data or []
+    except Exception:
+        rows = []
+    if rows:
+        profile = _row_to_profile(rows[0])
+        response_cache.put(user_id, "profile", profile)
+        return profile
+
+    # フォールバック：rows取得（single()は0件でPGRST116になるのでlimit(1)）
+    res = await (
+        db.table(USERS_TABLE)
+        .select(PROFILE_COLS)
         .eq("user_id", user_id)
         .limit(1)
         .execute()
     )
     rows = (res.data or [])
     if rows:
-        return _row_to_profile(rows[0])
-
-    # 未作成 → デフォルト作成（ユーザーメタからnameを拾えればそれを初期値に）
-    # メタ取得（失敗しても無視）
-    try:
-        auth = supabase.auth.get_user()
-        meta = getattr(getattr(auth, "user", None), "user_metadata", {}) or {}
-        initial_name = meta.get("name") or "User"
-    except Exception:
-        initial_name = "User"
+        profile = _row_to_profile(rows[0])
+        response_cache.put(user_id, "profile", profile)
+        return profile
 
+    # 未作成 → デフォルト作成
     payload = {"user_id": user_id, **_default_profile_payload(initial_name)}
-    supabase.table(USERS_TABLE).insert(payload).execute()
+    await db.table(USERS_TABLE).insert(payload).execute()
 
     return _row_to_profile(payload)
 
 
 @router.patch("/profile", response_model=ProfileOut)
-def update_my_profile(
+async def update_my_profile(
     payload: ProfileUpdate, user_id: str = Depends(get_user_id_from_bearer)
 ):
     """
-    display_name / avatar_url を更新。存在しなければ先にデフォルト作成してから更新結果を返す。
+    display_name / avatar_url を更新。存在しなければデフォルト値とマージしてUPSERT。
+    更新行は returning=representation で同じリクエスト内で受け取る（往復1回）。
     """
-    # まず存在確認
-    res0 = (
-        supabase.table(USERS_TABLE)
-        .select("user_id")
-        .eq("user_id", user_id)
-        .limit(1)
-        .execute()
-    )
-    exists = bool(res0.data)
-
-    if not exists:
-        # デフォルト作成
-        supabase.table(USERS_TABLE).insert({"user_id": user_id, **_default_profile_payload()}).execute()
-
     update_fields: Dict[str, Any] = {}
     if payload.display_name is not None:
         update_fields["display_name"] = payload.display_name
@@ -131,14 +142,28 @@ def update_my_profile(
         # 空パッチは400
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    supabase.table(USERS_TABLE).update(update_fields).eq("user_id", user_id).execute()
+    db = await get_supabase_async()
 
-    # 更新後の行を返す
-    res = (
-        supabase.table(USERS_TABLE)
-        .select("display_name, avatar_url, solo_count, team_count, badge_count")
+    # 既存行の部分更新（他フィールドは触らない）。更新後の行も同時に返る。
+    res = await (
+        db.table(USERS_TABLE)
+        .update(update_fields, returning="representation")
         .eq("user_id", user_id)
-        .limit(1)
+        .execute()
+    )
+    rows = res.data or []
+    if rows:
+        response_cache.invalidate(user_id)
+        return _row_to_profile(rows[0])
+
+    # 未作成 → デフォルト＋パッチ内容でUPSERT（作成と返却を1往復で）
+    res = await (
+        db.table(USERS_TABLE)
+        .upsert(
+            {"user_id": user_id, **_default_profile_payload(), **update_fields},
+            on_conflict="user_id",
+            returning="representation",
+        )
         .execute()
     )
     rows = res.data or []
@@ -146,4 +171,5 @@ def update_my_profile(
         # ここに来ることはほぼ無いが保険
         raise HTTPException(status_code=404, detail="Profile not found after update")
 
+    response_cache.invalidate(user_id)
     return _row_to_profile(rows[0])
\ No newline at end of file
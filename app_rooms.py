@@ -1,13 +1,22 @@
 # app_rooms.py
-from typing import Optional, List
+import asyncio
+import hashlib
+import hmac
+import time
+from typing import Annotated, Any, List, Optional
 from decimal import Decimal
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-from supabase_client import supabase
-import random, string  # generate_password に使用
+from postgrest.exceptions import APIError
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from supabase_client import supabase_as_async
+from auth_cache import get_user_cached
+import orjson
+import response_cache
+import singleflight
+import secrets, string  # generate_password に使用
 
 router = APIRouter(prefix="/rooms", tags=["rooms"])
 
@@ -15,13 +24,19 @@ router = APIRouter(prefix="/rooms", tags=["rooms"])
 class CreateSoloPayload(BaseModel):
     name: str
     title: str
-    target_value: Decimal
+    # numeric(12,4) 相当で検証（桁あふれをDBに行く前に弾く）
+    target_value: Decimal = Field(max_digits=12, decimal_places=4)
     unit: str
     password: Optional[str] = None
 
 class JoinRoomRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True, extra="forbid")
     room_id: int
-    password: str
+    password: str = Field(max_length=128)
+
+# model_construct で組むメンバー行の joined_at だけは datetime に寄せる必要がある
+# （生文字列のままだとシリアライズ時に UserWarning が出る）。アダプタは1個を使い回す。
+_DATETIME_ADAPTER = TypeAdapter(datetime)
 
 class RoomMemberDisplayInfo(BaseModel):
     user_id: str
@@ -34,10 +49,26 @@ class RoomBrief(BaseModel):
     id: int
     name: str
 
+class RoomDetail(BaseModel):
+    # フロントが使う列だけ返す（password は返さない）
+    id: int
+    name: Optional[str] = None
+    mode: str
+    host_id: str
+    created_at: Optional[datetime] = None
+
+class RoomCreatedResponse(BaseModel):
+    message: str
+    room_id: int
+    password: str
+
+class MessageResponse(BaseModel):
+    message: str
+
 class CreateGroupPayload(BaseModel):
     name: str
     title: str
-    target_value: Decimal
+    target_value: Decimal = Field(max_digits=12, decimal_places=4)
     unit: str
     password: Optional[str] = None  # 指定なければサーバ側で自動生成
 
@@ -47,364 +78,512 @@ bearer_scheme = HTTPBearer(auto_error=True)
 def get_access_token(creds: HTTPAuthorizationCredentials = Depends(bearer_scheme)) -> str:
     return creds.credentials
 
-def get_current_user(access_token: str = Depends(get_access_token)):
-    try:
-        resp = supabase.auth.get_user(access_token)
-        user = getattr(resp, "user", None)
-        if not user or not getattr(user, "id", None):
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        return user
-    except Exception:
+def require_user(
+    request: Request,
+    creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+) -> tuple:
+    """user と access_token を1つの依存関係でまとめて解決する（Depends 2段分を1段に）。
+
+    get_user_cached のフォールバックは同期HTTPSでGoTrueに出るため、
+    敢えて同期defのままにしてスレッドプールで実行させる
+    （async化するとSUPABASE_JWT_SECRET未設定の環境でイベントループを塞ぐ）。
+    """
+    token = creds.credentials
+    # ミドルウェアが検証済みならそれを使う（再検証なし）
+    user = getattr(request.state, "user", None) or get_user_cached(token)
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return user, token
+
+# 各エンドポイントで共有する依存関係のエイリアス（FastAPIの解析キャッシュも効く）
+AccessToken = Annotated[str, Depends(get_access_token)]
+UserCtx = Annotated[tuple, Depends(require_user)]
+
+# SELECT * を避けるための射影（インデックスオンリースキャンも効きやすくなる）
+_ROOM_DETAIL_COLS = "id,name,mode,host_id,created_at"
+
+# join_room RPC のステータス → HTTP の写像
+_JOIN_RPC_ERRORS = {
+    "not_found": (404, "Room not found."),
+    "bad_password": (401, "Invalid password."),
+    "solo_occupied": (409, "This is a solo room and is already occupied."),
+}
+
+# join バースト（同じ部屋に大量参加）時に rooms 行を毎回引かないための短命キャッシュ。
+# password/mode はほぼ不変なので数秒の陳腐化は許容する。部屋単位でユーザー非依存。
+_ROOM_META_TTL = 5
+_ROOM_META_MAX = 5000
+_room_meta_cache: dict = {}
+
+def _room_meta_get(room_id: int):
+    hit = _room_meta_cache.get(room_id)
+    if hit and hit[0] > time.time():
+        return hit[1]
+    return None
+
+def _room_meta_put(room_id: int, meta: dict) -> None:
+    if len(_room_meta_cache) >= _ROOM_META_MAX:
+        _room_meta_cache.clear()  # 短命キャッシュなので全捨てで十分
+    _room_meta_cache[room_id] = (time.time() + _ROOM_META_TTL, meta)
 
 # ====== Utils ======
+# パスワード文字種は毎回連結せずモジュール定数に
+_PWD_ALPHABET = string.ascii_uppercase + string.digits
+
+def _weak_etag(payload) -> str:
+    """レスポンス本文から弱いETagを作る（ポーリング時の304用）"""
+    digest = hashlib.blake2b(orjson.dumps(payload, default=str), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
 def generate_password(length: int = 6) -> str:
-    chars = string.ascii_uppercase + string.digits
-    return ''.join(random.choice(chars) for _ in range(length))
+    # 実質パスワードなので暗号論的に安全な secrets を使う（C実装で random.choice より速い）
+    return ''.join(secrets.choice(_PWD_ALPHABET) for _ in range(length))
 
 # ====== 1) ソロ作成: room + crystal + 自分をメンバー（RPC） ======
 @router.post("/solo")
-def create_solo_room(
+async def create_solo_room(
     payload: CreateSoloPayload,
-    access_token: str = Depends(get_access_token),
+    access_token: AccessToken,
 ):
-    try:
-        pg = supabase.postgrest
-        pg.auth(access_token)
-
-        resp = pg.rpc(
-            "create_solo_room_with_crystal",
-            {
-                "p_title": payload.title,
-                "p_target": str(payload.target_value),  # numeric は文字列で
-                "p_unit": payload.unit,
-                "p_password": payload.password,
-                "p_name": payload.name,
-            },
-        ).execute()
-
-        data = resp.data or []
-        if not data:
-            raise HTTPException(status_code=500, detail="RPC returned no data")
-
-        row = data[0]
-        room_id = row.get("room_id_out") or row.get("room_id")
-        crystal_id = row.get("crystal_id_out") or row.get("crystal_id")
-        if room_id is None or crystal_id is None:
-            raise HTTPException(status_code=500, detail=f"Unexpected RPC payload keys: {list(row.keys())}")
-
-        # rooms.name を念のため更新（無いスキーマでも try/except）
-        try:
-            pg.from_("rooms").update({"name": payload.name}).eq("id", room_id).execute()
-        except Exception:
-            pass
-
-        return {
-            "room_id": room_id,
-            "crystal_id": crystal_id,
-            "name": payload.name,
-            "title": payload.title,
-            "target_value": str(payload.target_value),
-            "unit": payload.unit,
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create solo room: {e}")
+    db = await supabase_as_async(access_token)
+    pg = db.postgrest
+
+    resp = await pg.rpc(
+        "create_solo_room_with_crystal",
+        {
+            "p_title": payload.title,
+            "p_target": str(payload.target_value),  # numeric は文字列で
+            "p_unit": payload.unit,
+            "p_password": payload.password,
+            "p_name": payload.name,
+        },
+    ).execute()
+
+    data = resp.data or []
+    if not data:
+        raise HTTPException(status_code=500, detail="RPC returned no data")
+
+    row = data[0]
+    room_id = row.get("room_id_out") or row.get("room_id")
+    crystal_id = row.get("crystal_id_out") or row.get("crystal_id")
+    if room_id is None or crystal_id is None:
+        raise HTTPException(status_code=500, detail=f"Unexpected RPC payload keys: {list(row.keys())}")
+
+    # rooms.name は RPC が p_name で設定するので追加のUPDATEは不要（1往復削減）
+
+    return {
+        "room_id": room_id,
+        "crystal_id": crystal_id,
+        "name": payload.name,
+        "title": payload.title,
+        "target_value": str(payload.target_value),
+        "unit": payload.unit,
+    }
 
 # ====== 2) 通常の部屋作成（rooms + 自分をhostでメンバー登録） ======
-@router.post("")
-def create_room(
-    current_user = Depends(get_current_user),
-    access_token: str = Depends(get_access_token),
+@router.post("", response_model=RoomCreatedResponse)
+async def create_room(
+    ctx: UserCtx,
 ):
-    try:
-        pg = supabase.postgrest
-        pg.auth(access_token)
+    current_user, access_token = ctx
+    db = await supabase_as_async(access_token)
+    pg = db.postgrest
 
-        password = generate_password()
+    password = generate_password()
 
-        # ★ insert 後の .select("*") を撤去
-        res_room = pg.from_("rooms").insert(
-            {
-                "host_id": current_user.id,
-                "password": password,
-                "mode": "solo",
-            },
-            returning="representation",   # ← 可能なら挿入行を返す
+    # rooms + rooms_members を1トランザクション・1往復にまとめたRPCを先に試す
+    # （create_solo_room_with_crystal と同じパターン。未デプロイ環境はフォールバック）
+    try:
+        resp = await pg.rpc(
+            "create_room_with_member",
+            {"p_mode": "solo", "p_name": None, "p_password": password},
         ).execute()
+        data = resp.data or []
+        if data:
+            row = data[0] if isinstance(data, list) else data
+            rpc_room_id = row.get("room_id_out") or row.get("room_id") if isinstance(row, dict) else row
+            if rpc_room_id is not None:
+                return {"message": "Room created successfully.", "room_id": rpc_room_id, "password": password}
+    except Exception:
+        pass  # フォールバックへ
 
-        data = res_room.data or []
-        created = data[0] if data else None
-
-        # フォールバック: 返ってこない環境向けに、直近の自分の部屋を拾う
-        if not created:
-            sel = pg.from_("rooms") \
-                .select("id,name,host_id,password,mode") \
-                .eq("host_id", current_user.id) \
-                .order("id", desc=True) \
-                .limit(1) \
-                .execute()
-            created = (sel.data or [None])[0]
+    # 使うのは id だけなので representation も id に絞る
+    builder = pg.from_("rooms").insert(
+        {
+            "host_id": current_user.id,
+            "password": password,
+            "mode": "solo",
+        },
+        returning="representation",   # ← 可能なら挿入行を返す
+    )
+    builder.params = builder.params.set("select", "id")
+    res_room = await builder.execute()
+
+    data = res_room.data or []
+    created = data[0] if data else None
+
+    # フォールバック: 返ってこない環境向けに、直近の自分の部屋を拾う
+    if not created:
+        sel = await pg.from_("rooms") \
+            .select("id") \
+            .eq("host_id", current_user.id) \
+            .order("id", desc=True) \
+            .limit(1) \
+            .execute()
+        created = (sel.data or [None])[0]
 
-        if not created:
-            raise HTTPException(status_code=500, detail="Room insert failed")
+    if not created:
+        raise HTTPException(status_code=500, detail="Room insert failed")
 
-        room_id = created["id"]
+    room_id = created["id"]
 
-        pg.from_("rooms_members").upsert(
-            {
-                "room_id": room_id,
-                "user_id": current_user.id,
-                "role": "host",
-            },
-            on_conflict="room_id,user_id",
-        ).execute()
+    await pg.from_("rooms_members").upsert(
+        {
+            "room_id": room_id,
+            "user_id": current_user.id,
+            "role": "host",
+        },
+        on_conflict="room_id,user_id",
+        returning="minimal",  # 戻り行は使わないので転送しない
+    ).execute()
 
-        return {"message": "Room created successfully.", "room_id": room_id, "password": password}
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database operation failed: {e}")
+    return {"message": "Room created successfully.", "room_id": room_id, "password": password}
 
 # --- 3) グループルーム作成 ---
 # --- 3) グループルーム作成 ---
 @router.post("/group")
-def create_group_room(
+async def create_group_room(
     payload: CreateGroupPayload,
-    access_token: str = Depends(get_access_token),
+    ctx: UserCtx,
 ):
     """グループモードの部屋を作成し、作成者をホストとしてメンバー登録。結晶も作成。"""
-    try:
-        resp = supabase.auth.get_user(access_token)
-        user = getattr(resp, "user", None)
-        if not user or not getattr(user, "id", None):
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    current_user, access_token = ctx
+    db = await supabase_as_async(access_token)
+    pg = db.postgrest
 
-        pg = supabase.postgrest
-        pg.auth(access_token)
+    password = payload.password or generate_password()
 
-        password = payload.password or generate_password()
-
-        # ★ insert 後の .select("*") を撤去
-        res_room = pg.from_("rooms").insert(
+    # まずは create_solo_room_with_crystal と同形の複合RPCで
+    # rooms + rooms_members + crystals を1トランザクション・1往復に。
+    # 未デプロイの環境では従来の逐次insertにフォールバック。
+    try:
+        resp = await pg.rpc(
+            "create_group_room_with_crystal",
             {
-                "host_id": user.id,
-                "password": password,
-                "mode": "group",
-                "name": payload.name,
+                "p_name": payload.name,
+                "p_title": payload.title,
+                "p_target": str(payload.target_value),  # numeric は文字列で
+                "p_unit": payload.unit,
+                "p_password": password,
             },
-            returning="representation",   # ← 返ってくるならここで受け取る
         ).execute()
+        data = resp.data or []
+        if data:
+            row = data[0]
+            room_id = row.get("room_id_out") or row.get("room_id")
+            if room_id is not None:
+                return {
+                    "message": "Group room & crystal created successfully.",
+                    "room_id": room_id,
+                    "password": password,
+                    "crystal": {
+                        "title": payload.title,
+                        "target_value": str(payload.target_value),
+                        "unit": payload.unit,
+                    }
+                }
+    except Exception:
+        pass  # フォールバックへ
 
-        data = res_room.data or []
-        created = data[0] if data else None
-
-        # フォールバック: 直近の自分のグループ部屋を拾う
-        if not created:
-            sel = pg.from_("rooms") \
-                .select("id,name,host_id,password,mode") \
-                .eq("host_id", user.id) \
-                .eq("mode", "group") \
-                .order("id", desc=True) \
-                .limit(1) \
-                .execute()
-            created = (sel.data or [None])[0]
-
-        if not created:
-            raise HTTPException(status_code=500, detail="Group room insert failed")
-        room_id = created["id"]
-
-        # name フォールバック更新（不要なら無視される）
-        try:
-            if not created.get("name"):
-                pg.from_("rooms").update({"name": payload.name}).eq("id", room_id).execute()
-        except Exception:
-            pass
-
-        # host としてメンバー登録
-        pg.from_("rooms_members").upsert(
-            {
-                "room_id": room_id,
-                "user_id": user.id,
-                "role": "host",
-            },
-            on_conflict="room_id,user_id",
-        ).execute()
+    # 使うのは id / name だけなので representation もその2列に絞る
+    builder = pg.from_("rooms").insert(
+        {
+            "host_id": current_user.id,
+            "password": password,
+            "mode": "group",
+            "name": payload.name,
+        },
+        returning="representation",   # ← 返ってくるならここで受け取る
+    )
+    builder.params = builder.params.set("select", "id,name")
+    res_room = await builder.execute()
+
+    data = res_room.data or []
+    created = data[0] if data else None
+
+    # フォールバック: 直近の自分のグループ部屋を拾う
+    if not created:
+        sel = await pg.from_("rooms") \
+            .select("id,name") \
+            .eq("host_id", current_user.id) \
+            .eq("mode", "group") \
+            .order("id", desc=True) \
+            .limit(1) \
+            .execute()
+        created = (sel.data or [None])[0]
 
-        # crystals 作成（insertのみ：ここでも .select はしない）
-        pg.from_("crystals").insert(
-            {
-                "room_id": room_id,
-                "title": payload.title,
-                "target_value": str(payload.target_value),
-                "unit": payload.unit,
-            }
-        ).execute()
+    if not created:
+        raise HTTPException(status_code=500, detail="Group room insert failed")
+    room_id = created["id"]
+
+    # name フォールバック更新（不要なら無視される）
+    try:
+        if not created.get("name"):
+            await pg.from_("rooms").update({"name": payload.name}).eq("id", room_id).execute()
+    except Exception:
+        pass
 
-        return {
-            "message": "Group room & crystal created successfully.",
+    # host としてメンバー登録
+    await pg.from_("rooms_members").upsert(
+        {
             "room_id": room_id,
-            "password": password,
-            "crystal": {
-                "title": payload.title,
-                "target_value": str(payload.target_value),
-                "unit": payload.unit,
-            }
+            "user_id": current_user.id,
+            "role": "host",
+        },
+        on_conflict="room_id,user_id",
+        returning="minimal",  # 戻り行は使わないので転送しない
+    ).execute()
+
+    # crystals 作成（insertのみ：戻り行も不要）
+    await pg.from_("crystals").insert(
+        {
+            "room_id": room_id,
+            "title": payload.title,
+            "target_value": str(payload.target_value),
+            "unit": payload.unit,
+        },
+        returning="minimal",
+    ).execute()
+
+    return {
+        "message": "Group room & crystal created successfully.",
+        "room_id": room_id,
+        "password": password,
+        "crystal": {
+            "title": payload.title,
+            "target_value": str(payload.target_value),
+            "unit": payload.unit,
         }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create group room with crystal: {e}")
+    }
     
 # ====== 4) 参加（パスワード検証 + メンバー登録） ======
-@router.post("/join")
-def join_room(
+@router.post("/join", response_model=MessageResponse)
+async def join_room(
     req: JoinRoomRequest,
-    current_user = Depends(get_current_user),
-    access_token: str = Depends(get_access_token),
+    ctx: UserCtx,
 ):
+    current_user, access_token = ctx
+    db = await supabase_as_async(access_token)
+    pg = db.postgrest
+
+    # パスワード検証・ソロ占有チェック・upsert を1関数にまとめたRPCを先に試す
+    # （3往復→1往復。検証とinsertの間のレースも閉じる）。未デプロイならフォールバック。
     try:
-        pg = supabase.postgrest
-        pg.auth(access_token)
+        resp = await pg.rpc(
+            "join_room",
+            {"p_room_id": req.room_id, "p_password": req.password},
+        ).execute()
+        status = resp.data
+        if isinstance(status, list):
+            status = status[0] if status else None
+        if isinstance(status, dict):
+            status = status.get("status")
+        if status == "ok":
+            response_cache.invalidate(current_user.id)  # 書き込み後は自分のキャッシュを破棄
+            return {"message": "Successfully joined the room."}
+        if status in _JOIN_RPC_ERRORS:
+            code, detail = _JOIN_RPC_ERRORS[status]
+            raise HTTPException(status_code=code, detail=detail)
+    except HTTPException:
+        raise
+    except Exception:
+        pass  # フォールバックへ
 
-        room_res = pg.from_("rooms").select("id,password,mode").eq("id", req.room_id).limit(1).execute()
+    room = _room_meta_get(req.room_id)
+    if room is None:
+        room_res = await pg.from_("rooms").select("id,password,mode").eq("id", req.room_id).limit(1).execute()
         room_rows = room_res.data or []
         room = room_rows[0] if room_rows else None
-        if not room:
-            raise HTTPException(status_code=404, detail="Room not found.")
-        if room["password"] != req.password:
-            raise HTTPException(status_code=401, detail="Invalid password.")
-
-        # ソロは1人のみ
-        if room["mode"] == "solo":
-            exists_res = pg.from_("rooms_members").select("user_id").eq("room_id", req.room_id).limit(1).execute()
-            if exists_res.data and len(exists_res.data) > 0:
-                raise HTTPException(status_code=409, detail="This is a solo room and is already occupied.")
-
-        pg.from_("rooms_members").upsert({
+        if room:
+            _room_meta_put(req.room_id, room)
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found.")
+    # タイミング攻撃対策に定数時間比較（RPC経路ではDB側で検証済み）。
+    # compare_digest は非ASCIIのstrを受け付けないのでUTF-8バイト列で比較する
+    if not hmac.compare_digest(str(room["password"] or "").encode(), req.password.encode()):
+        raise HTTPException(status_code=401, detail="Invalid password.")
+
+    # ソロ1人制約は事前SELECTではなくDB側のユニーク部分インデックス
+    # （solo_room_one_member ON rooms_members(room_id) WHERE solo）に任せる。
+    # 事前チェックはTOCTOUレースがある上に1往復余計だった。
+    try:
+        await pg.from_("rooms_members").upsert({
             "room_id": req.room_id,
             "user_id": current_user.id,
             "role": "member",
-        }, on_conflict="room_id,user_id").execute()
-
-        return {"message": "Successfully joined the room."}
-    except HTTPException:
+        }, on_conflict="room_id,user_id", returning="minimal").execute()
+    except APIError as e:
+        if getattr(e, "code", None) == "23505":
+            raise HTTPException(status_code=409, detail="This is a solo room and is already occupied.")
         raise
-    except Exception as e:
-        if "rows not found" in str(e):
-            raise HTTPException(status_code=404, detail="Room not found.")
-        raise HTTPException(status_code=500, detail=str(e))
 
-# ====== 5) 自分の所属ルーム一覧（id, name） ← 静的パスを先に置く／アプリ側で降順ソート
+    response_cache.invalidate(current_user.id)  # 書き込み後は自分のキャッシュを破棄
+    return {"message": "Successfully joined the room."}
+
+# ====== 5) 自分の所属ルーム一覧（id, name） ← 静的パスを先に置く
 @router.get("/mine", response_model=List[RoomBrief], summary="自分の所属ルーム一覧（id,name）")
-def list_my_rooms(
-    current_user = Depends(get_current_user),
-    access_token: str = Depends(get_access_token),
+async def list_my_rooms(
+    ctx: UserCtx,
+    request: Request,
+    response: Response,
 ):
     """
     rooms_members から自分の room_id を取り出し、rooms の id/name を返す。
-    joined_at は Python 側で降順ソート（PostgREST の order パース不具合を回避）。
+    埋め込みselectで1往復・1 SQL join（joined_at はDB側で降順）。
+    (room_id, user_id) が一意なので重複排除は不要。
     """
-    try:
-        pg = supabase.postgrest
-        pg.auth(access_token)
-
-        # 1) 自分の membership を取得（DBでは order しない）
-        mem = pg.from_("rooms_members").select("room_id, joined_at").eq("user_id", current_user.id).execute()
-        rows = mem.data or []
-
-        # joined_at 降順（新しい順）に整列
-        rows.sort(key=lambda r: r.get("joined_at") or "", reverse=True)
-
-        # 重複排除しつつ順序維持
-        room_ids: list[int] = []
-        seen = set()
-        for r in rows:
-            rid = r["room_id"]
-            if rid not in seen:
-                seen.add(rid)
-                room_ids.append(rid)
-
-        if not room_ids:
-            return []
-
-        # 2) rooms から id/name を一括取得
-        rms = pg.from_("rooms").select("id,name").in_("id", room_ids).execute()
-        items = rms.data or []
-
-        # membership順に並べ替え
-        order = {rid: i for i, rid in enumerate(room_ids)}
-        items.sort(key=lambda x: order.get(x["id"], 10**9))
-
-        return [{"id": it["id"], "name": it.get("name", "") or ""} for it in items]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+    current_user, access_token = ctx
+    db = await supabase_as_async(access_token)
+    pg = db.postgrest
+
+    res = await (
+        pg.from_("rooms_members")
+        .select("room_id, joined_at, rooms!inner(id,name)")
+        .eq("user_id", current_user.id)
+        .order("joined_at", desc=True)
+        .execute()
+    )
+    out: list[dict] = []
+    for r in (res.data or []):
+        room = r.get("rooms") or {}
+        if isinstance(room, list):
+            room = room[0] if room else {}
+        out.append({"id": room.get("id", r["room_id"]), "name": room.get("name", "") or ""})
+
+    etag = _weak_etag(out)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return out
 
 # ====== 6) 特定の部屋情報を取得（動的パスは最後に）
-@router.get("/{room_id}", response_model=dict)
-def get_room_details(
+@router.get("/{room_id}", response_model=RoomDetail)
+async def get_room_details(
     room_id: int,
-    current_user = Depends(get_current_user),
-    access_token: str = Depends(get_access_token),
+    ctx: UserCtx,
+    request: Request,
+    response: Response,
 ):
+    current_user, access_token = ctx
+
+    def _finish(payload):
+        # ポーリング向け: 本文ハッシュの弱いETagで一致時は304（本文ゼロバイト）
+        etag = _weak_etag(payload)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        return payload
+
+    # 部屋のメタデータ（mode/host）とメンバーシップはほぼ不変なので短命キャッシュが効く
+    cache_key = f"room:{room_id}"
+    cached = response_cache.get(current_user.id, cache_key)
+    if cached is not None:
+        return _finish(cached)
+
+    db = await supabase_as_async(access_token)
+    pg = db.postgrest
+
+    # メンバーシップ条件を埋め込みフィルタで同時に課す（ヒット時は1往復）
+    room = None
+    embedded_ok = False
     try:
-        pg = supabase.postgrest
-        pg.auth(access_token)
-
-        response = pg.from_("rooms").select("*").eq("id", room_id).limit(1).execute()
-        room = (response.data or [None])[0]
-        if not room:
-            raise HTTPException(status_code=404, detail="Room not found.")
-
-        is_member_res = pg.from_("rooms_members").select("user_id").eq("room_id", room_id).eq("user_id", current_user.id).limit(1).execute()
-        if not (is_member_res.data and len(is_member_res.data) > 0):
-            raise HTTPException(status_code=403, detail="Forbidden: You are not a member of this room.")
+        # 同時に来た同一ユーザー・同一部屋のGETは1回のクエリに束ねる
+        res = await singleflight.coalesce(
+            f"{current_user.id}:room:{room_id}",
+            lambda: pg.from_("rooms")
+            .select(f"{_ROOM_DETAIL_COLS}, rooms_members!inner(user_id)")
+            .eq("id", room_id)
+            .eq("rooms_members.user_id", current_user.id)
+            .limit(1)
+            .execute(),
+        )
+        rows = res.data or []
+        embedded_ok = True
+        if rows:
+            room = rows[0]
+            room.pop("rooms_members", None)  # 埋め込み列はレスポンスに含めない
+    except Exception:
+        pass  # 埋め込み不可の環境は従来の2往復へ
 
-        return room
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    if room:
+        response_cache.put(current_user.id, cache_key, room)
+        return _finish(room)
 
-# ====== 7) 部屋メンバーのリストを取得（Python 側で joined_at 昇順ソート）
+    if embedded_ok:
+        # ミス時のみ（コールドパス）404/403 を判別する追加クエリ
+        res = await pg.from_("rooms").select("id").eq("id", room_id).limit(1).execute()
+        if not (res.data or []):
+            raise HTTPException(status_code=404, detail="Room not found.")
+        raise HTTPException(status_code=403, detail="Forbidden: You are not a member of this room.")
+
+    # 独立な2クエリは直列ではなく並行に（待ち時間が sum→max になる）
+    room_res, is_member_res = await asyncio.gather(
+        pg.from_("rooms").select(_ROOM_DETAIL_COLS).eq("id", room_id).limit(1).execute(),
+        pg.from_("rooms_members").select("user_id").eq("room_id", room_id).eq("user_id", current_user.id).limit(1).execute(),
+    )
+    room = (room_res.data or [None])[0]
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found.")
+    if not (is_member_res.data and len(is_member_res.data) > 0):
+        raise HTTPException(status_code=403, detail="Forbidden: You are not a member of this room.")
+
+    response_cache.put(current_user.id, cache_key, room)
+    return _finish(room)
+
+# ====== 7) 部屋メンバーのリストを取得（joined_at 昇順はDB側で）
 @router.get("/{room_id}/members", response_model=List[RoomMemberDisplayInfo])
-def get_room_members(
+async def get_room_members(
     room_id: int,
-    current_user = Depends(get_current_user),
-    access_token: str = Depends(get_access_token),
+    ctx: UserCtx,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
 ):
-    try:
-        pg = supabase.postgrest
-        pg.auth(access_token)
-
-        res = (
-            pg.from_("rooms_members")
-            .select("user_id, joined_at, role, users!inner(display_name, avatar_url)")
-            .eq("room_id", room_id)
-            .execute()
+    current_user, access_token = ctx
+    # メンバーリストも読み取り超過なので短命キャッシュ対象（join時に自分の分は無効化）
+    cache_key = f"members:{room_id}:{offset}:{limit}"
+    cached = response_cache.get(current_user.id, cache_key)
+    if cached is not None:
+        return cached
+
+    db = await supabase_as_async(access_token)
+    pg = db.postgrest
+
+    res = await singleflight.coalesce(
+        f"{current_user.id}:members:{room_id}:{offset}:{limit}",
+        lambda: pg.from_("rooms_members")
+        .select("user_id, joined_at, role, users!inner(display_name, avatar_url)")
+        .eq("room_id", room_id)
+        .order("joined_at", desc=False)  # 昇順（古い順）はDB側でソート
+        .range(offset, offset + limit - 1)  # 巨大ルームでも応答サイズを有界に
+        .execute(),
+    )
+    rows = res.data or []
+
+    # 自DB由来の信頼できるデータなので文字列フィールドの検証はスキップ。
+    # joined_at だけは datetime 宣言なのでアダプタでパースして渡す
+    # （生文字列のままだと PydanticSerializationUnexpectedValue 警告が出る）。
+    # to-one の !inner 埋め込みは単一オブジェクトで返るのが PostgREST の仕様なので
+    # list/dict の型プローブはしない。
+    members = [
+        RoomMemberDisplayInfo.model_construct(
+            user_id=m["user_id"],
+            display_name=(u := m.get("users") or {}).get("display_name", ""),
+            avatar_url=u.get("avatar_url"),
+            role=m["role"],
+            joined_at=_DATETIME_ADAPTER.validate_python(m["joined_at"]),
         )
-        rows = res.data or []
+        for m in rows
+    ]
+    response_cache.put(current_user.id, cache_key, members)
+    return members
 
-        # joined_at 昇順（古い順）に整列
-        rows.sort(key=lambda r: r.get("joined_at") or "")
-
-        members_list: List[RoomMemberDisplayInfo] = []
-        for m in rows:
-            user_info = m.get("users")
-            if isinstance(user_info, list):
-                user_info = user_info[0] if user_info else None
-            user_info = user_info or {}
-            members_list.append(
-                RoomMemberDisplayInfo(
-                    user_id=m["user_id"],
-                    display_name=user_info.get("display_name", ""),
-                    avatar_url=user_info.get("avatar_url"),
-                    role=m["role"],
-                    joined_at=m["joined_at"],
-                )
-            )
-        return members_list
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch room members: {e}")
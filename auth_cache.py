@@ -0,0 +1,113 @@
+# auth_cache.py
+import os
+import time
+from typing import Any, Dict, Optional
+
+import jwt
+
+import supabase_client
+
+# SupabaseのJWT秘密鍵（HS256）。未設定ならローカル検証せず GoTrue にフォールバック。
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+
+# ローカル検証した claims のキャッシュ（token → (expires_at, user)）
+_CACHE_MAXSIZE = 10_000
+_CACHE_TTL = 300  # JWT の exp とどちらか短い方まで保持
+_cache: Dict[str, tuple] = {}
+
+
+class CachedUser:
+    """supabase.auth.get_user().user の必要最小限の互換オブジェクト"""
+
+    __slots__ = ("id", "email", "user_metadata")
+
+    def __init__(self, user_id: str, email: Optional[str], user_metadata: Dict[str, Any]):
+        self.id = user_id
+        self.email = email
+        self.user_metadata = user_metadata
+
+
+def _evict_if_needed() -> None:
+    if len(_cache) < _CACHE_MAXSIZE:
+        return
+    now = time.time()
+    expired = [k for k, (exp, _) in _cache.items() if exp <= now]
+    for k in expired:
+        _cache.pop(k, None)
+    # 期限内で埋まっている場合は古い順に半分落とす
+    if len(_cache) >= _CACHE_MAXSIZE:
+        for k in list(_cache)[: _CACHE_MAXSIZE // 2]:
+            _cache.pop(k, None)
+
+
+def _decode_local(token: str) -> Optional[CachedUser]:
+    """JWTをローカルで署名検証してユーザーを復元。検証できなければ None。"""
+    if not SUPABASE_JWT_SECRET:
+        return None
+    try:
+        claims = jwt.decode(
+            token,
+            SUPABASE_JWT_SECRET,
+            algorithms=["HS256"],
+            audience="authenticated",
+        )
+    except jwt.PyJWTError:
+        return None
+    sub = claims.get("sub")
+    if not sub:
+        return None
+    user = CachedUser(sub, claims.get("email"), claims.get("user_metadata") or {})
+    expires_at = min(claims.get("exp", time.time() + _CACHE_TTL), time.time() + _CACHE_TTL)
+    _evict_if_needed()
+    _cache[token] = (expires_at, user)
+    return user
+
+
+def peek_user_cached(token: str) -> Optional[CachedUser]:
+    """
+    ネットワークを一切使わない版：キャッシュヒットかローカル署名検証のみ。
+    （ASGIミドルウェアなどイベントループ上で呼ぶ場所向け）
+    """
+    hit = _cache.get(token)
+    if hit:
+        expires_at, user = hit
+        if expires_at > time.time():
+            return user
+        _cache.pop(token, None)
+
+    return _decode_local(token)
+
+
+def get_user_cached(token: str) -> Optional[CachedUser]:
+    """
+    Bearerトークンからユーザーを取得。
+    1) キャッシュヒットならネットワークなしで即返す
+    2) ローカルで署名検証（SUPABASE_JWT_SECRET があれば）
+    3) どちらも不可なら GoTrue (auth.get_user) にフォールバック
+    無効なトークンは None。
+    """
+    user = peek_user_cached(token)
+    if user:
+        return user
+
+    # JWTの体裁すらしていないトークン（bot/スキャナ由来）でネットワークに出ない
+    if token.count(".") != 2 or len(token) < 20:
+        return None
+
+    # フォールバック：従来どおり GoTrue に問い合わせ
+    # （モジュール属性経由で参照し、匿名クライアントの遅延構築を保つ）
+    try:
+        resp = supabase_client.supabase.auth.get_user(token)
+    except Exception:
+        return None
+    remote = getattr(resp, "user", None)
+    if not remote or not getattr(remote, "id", None):
+        return None
+    user = CachedUser(
+        remote.id,
+        getattr(remote, "email", None),
+        getattr(remote, "user_metadata", None) or {},
+    )
+    _evict_if_needed()
+    _cache[token] = (time.time() + _CACHE_TTL, user)
+    return user
@@ -0,0 +1,31 @@
+# auth_middleware.py
+from auth_cache import peek_user_cached
+
+
+class AuthASGIMiddleware:
+    """
+    Bearerトークンの抽出とJWT検証をASGI層で1回だけ行い、
+    検証済みユーザーを scope["state"]["user"] に置く純ASGIミドルウェア。
+    Depends 側はこの値を拾うだけになり、ハンドラ毎の再検証コストが消える。
+
+    ここでは拒否しない（401の体裁・OpenAPIは各エンドポイントの依存関係に任せる）。
+    ネットワークフォールバックもしない（イベントループをブロックしないため、
+    キャッシュ／ローカル署名検証のみ）。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            auth = None
+            for key, value in scope.get("headers") or ():
+                if key == b"authorization":
+                    auth = value
+                    break
+            if auth is not None and auth[:7].lower() == b"bearer ":
+                token = auth[7:].decode("latin-1").strip()
+                user = peek_user_cached(token)
+                if user is not None:
+                    scope.setdefault("state", {})["user"] = user
+        await self.app(scope, receive, send)
@@ -1,10 +1,15 @@
 # main.py
-from fastapi import FastAPI, HTTPException
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field
+from postgrest.exceptions import APIError
 from starlette.status import HTTP_400_BAD_REQUEST, HTTP_500_INTERNAL_SERVER_ERROR
 
-from supabase_client import supabase
+from supabase_client import get_supabase_async, aclose_async_clients
+from auth_middleware import AuthASGIMiddleware
 
 # Sub-routers
 from app_profile import router as me_router
@@ -14,8 +19,31 @@ from app_crystal import router as crystals_router  # 結晶系エンドポイン
 app = FastAPI(
     title="CrystaRise API",
     version="1.0.0",
+    # stdlib jsonよりエンコードが速い（サマリー系のホットパスで効く）
+    default_response_class=ORJSONResponse,
 )
 
+# ===== PostgREST エラーの一括マッピング =====
+# 各ハンドラで try/except Exception → 500 に包み直す代わりに、
+# PostgREST / Postgres のエラーコードをここで一度だけHTTPステータスへ写像する。
+# （ハンドラは直線コードになり、ホットパスのフレームと文字列走査が消える）
+_PG_ERROR_STATUS = {
+    "PGRST116": 404,  # rows not found（single()系）
+    "23505": 409,     # unique_violation
+    "23503": 404,     # foreign_key_violation（参照先が見えない/無い）
+    "42501": 403,     # insufficient_privilege（RLS拒否）
+}
+
+@app.exception_handler(APIError)
+async def postgrest_error_handler(request, exc: APIError):
+    code = getattr(exc, "code", None)
+    status = _PG_ERROR_STATUS.get(code, HTTP_500_INTERNAL_SERVER_ERROR)
+    detail = getattr(exc, "message", None) or str(exc)
+    return ORJSONResponse(status_code=status, content={"detail": detail})
+
+# ===== Auth (ASGI層でBearer検証を先に済ませる) =====
+app.add_middleware(AuthASGIMiddleware)
+
 # ===== CORS =====
 app.add_middleware(
     CORSMiddleware,
@@ -25,15 +53,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ===== Preflight for any path =====
-@app.options("/{rest_of_path:path}")
-def preflight_handler(rest_of_path: str):
-    return {}
+# ===== Shutdown: プールしたHTTPセッションを閉じる =====
+@app.on_event("shutdown")
+async def shutdown_http_pools():
+    await aclose_async_clients()
 
 # ===== Health =====
-@app.get("/")
-def health():
-    return {"ok": True, "message": "Hello, World!"}
+class HealthResponse(BaseModel):
+    ok: bool
+    message: str
+
+# LBのプローブが高頻度で叩くので、本文は起動時に1回だけシリアライズしておく
+_HEALTH_BODY = b'{"ok":true,"message":"Hello, World!"}'
+_HEALTH_ETAG = '"health-v1"'
+
+@app.get("/", response_model=HealthResponse)
+def health(request: Request):
+    if request.headers.get("if-none-match") == _HEALTH_ETAG:
+        return Response(status_code=304, headers={"ETag": _HEALTH_ETAG})
+    return Response(
+        content=_HEALTH_BODY,
+        media_type="application/json",
+        headers={"ETag": _HEALTH_ETAG, "Cache-Control": "public, max-age=60"},
+    )
 
 # ===== Include sub-routers =====
 # /me/* エンドポイント
@@ -43,20 +85,48 @@ app.include_router(rooms_router)
 # /crystals/* エンドポイント（結晶の作成・記録・集計）
 app.include_router(crystals_router)
 
+# ルータの二重 include 検知（同一 path+method が重複すると全リクエストが余計な
+# マッチングを踏むか、静かに片方へ吸われる。起動時に大声で落とす）
+_seen_routes: set = set()
+for _route in app.routes:
+    _key = (_route.path, tuple(sorted(getattr(_route, "methods", None) or ())))
+    if _key in _seen_routes:
+        raise RuntimeError(f"Duplicate route registration: {_key}")
+    _seen_routes.add(_key)
+del _seen_routes, _route, _key
+
 # ===== Auth DTO =====
+# frozen + extra="forbid" で pydantic-core の最速パスに乗せつつ、
+# 長さ制限で巨大ペイロードを検証前に安く弾く
 class UserSignUpRequest(BaseModel):
-    email: str
-    password: str
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True, extra="forbid")
+    email: str = Field(max_length=254)
+    password: str = Field(min_length=6, max_length=128)
 
 class UserSignInRequest(BaseModel):
-    email: str
-    password: str
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True, extra="forbid")
+    email: str = Field(max_length=254)
+    password: str = Field(min_length=6, max_length=128)
+
+class MessageResponse(BaseModel):
+    message: str
+
+class SignInUser(BaseModel):
+    id: Optional[str] = None
+    email: Optional[str] = None
+    user_metadata: Optional[Dict[str, Any]] = None
+
+class SignInResponse(BaseModel):
+    message: str
+    access_token: str
+    user: Optional[SignInUser] = None
 
 # ===== Auth endpoints =====
-@app.post("/auth/signup", tags=["auth"])
-def signup(user_request: UserSignUpRequest):
+@app.post("/auth/signup", response_model=MessageResponse, tags=["auth"])
+async def signup(user_request: UserSignUpRequest):
     try:
-        resp = supabase.auth.sign_up({
+        db = await get_supabase_async()
+        resp = await db.auth.sign_up({
             "email": user_request.email,
             "password": user_request.password,
         })
@@ -66,10 +136,11 @@ def signup(user_request: UserSignUpRequest):
     except Exception as e:
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(e))
 
-@app.post("/auth/signin", tags=["auth"])
-def signin(user_request: UserSignInRequest):
+@app.post("/auth/signin", response_model=SignInResponse, tags=["auth"])
+async def signin(user_request: UserSignInRequest):
     try:
-        resp = supabase.auth.sign_in_with_password({
+        db = await get_supabase_async()
+        resp = await db.auth.sign_in_with_password({
             "email": user_request.email,
             "password": user_request.password,
         })
@@ -77,11 +148,15 @@ def signin(user_request: UserSignInRequest):
             user_obj = getattr(resp, "user", None)
             user_payload = None
             if user_obj:
-                user_payload = {
-                    "id": getattr(user_obj, "id", None),
-                    "email": getattr(user_obj, "email", None),
-                    "user_metadata": getattr(user_obj, "user_metadata", None),
-                }
+                try:
+                    # pydanticモデルならC実装のdumpで1回で辞書化（getattr 4連より速い）
+                    user_payload = user_obj.model_dump(include={"id", "email", "user_metadata"})
+                except AttributeError:
+                    user_payload = {
+                        "id": getattr(user_obj, "id", None),
+                        "email": getattr(user_obj, "email", None),
+                        "user_metadata": getattr(user_obj, "user_metadata", None),
+                    }
             return {
                 "message": "User signed in successfully.",
                 "access_token": resp.session.access_token,
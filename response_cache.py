@@ -0,0 +1,38 @@
+# response_cache.py
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# 読み取り系エンドポイント用の短命レスポンスキャッシュ。
+# RLS の境界を跨がないよう、キーには必ず user_id を含める。
+# 書き込み系エンドポイントは invalidate(user_id) で自分のエントリを消す。
+# （他メンバーのキャッシュは TTL 経過で自然に追随）
+_TTL = 10  # 秒。記録追加の反映が最大この秒数だけ遅れてよい前提
+_MAXSIZE = 4096
+_store: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+
+
+def get(user_id: str, key: str) -> Optional[Any]:
+    hit = _store.get((user_id, key))
+    if not hit:
+        return None
+    expires_at, value = hit
+    if expires_at <= time.time():
+        _store.pop((user_id, key), None)
+        return None
+    return value
+
+
+def put(user_id: str, key: str, value: Any) -> None:
+    if len(_store) >= _MAXSIZE:
+        now = time.time()
+        for k in [k for k, (exp, _) in _store.items() if exp <= now]:
+            _store.pop(k, None)
+        if len(_store) >= _MAXSIZE:
+            _store.clear()  # まだ溢れるなら全捨て（短命キャッシュなので許容）
+    _store[(user_id, key)] = (time.time() + _TTL, value)
+
+
+def invalidate(user_id: str) -> None:
+    """このユーザーのキャッシュを全て破棄（書き込み後に呼ぶ）"""
+    for k in [k for k in _store if k[0] == user_id]:
+        _store.pop(k, None)
@@ -0,0 +1,28 @@
+# singleflight.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+# 同一キーの読み取りが同時多発したとき、上流クエリを1回に束ねる（request coalescing）。
+# 先頭の呼び出しだけが supplier を実行し、後続は同じ Future を await する。
+# RLS の境界を跨がないよう、キーには response_cache と同様 user_id を含めること。
+_inflight: Dict[str, "asyncio.Future[Any]"] = {}
+
+
+async def coalesce(key: str, supplier: Callable[[], Awaitable[Any]]) -> Any:
+    fut = _inflight.get(key)
+    if fut is not None:
+        return await fut
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        result = await supplier()
+    except BaseException as e:
+        _inflight.pop(key, None)
+        fut.set_exception(e)
+        fut.exception()  # 後続がいない場合の「exception never retrieved」警告を抑止
+        raise
+    else:
+        _inflight.pop(key, None)
+        fut.set_result(result)
+        return result
@@ -1,31 +1,103 @@
 # supabase_client.py
 import os
-from supabase import create_client, Client
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import httpx
+from supabase import create_client, Client, acreate_client, AsyncClient
 
 # --- .env 読み込み（python-dotenv が無くても動くように） ---
+# 本番では実環境変数が設定済みなので、.env のパースは未設定のとき（=ローカル開発）だけ行う
+if not os.environ.get("SUPABASE_URL") and not os.environ.get("NEXT_PUBLIC_SUPABASE_URL"):
+    try:
+        from dotenv import load_dotenv  # type: ignore
+        load_dotenv()
+    except Exception:
+        pass  # 未インストールでもOK。環境変数は別途設定しておくこと
+
+# 解決済みの設定はfrozen+slotsのインスタンスに固める。
+# 以後の参照はC実装のLOAD_ATTR一発で、os.environの辞書引きを繰り返さない。
+@dataclass(frozen=True, slots=True)
+class _Config:
+    url: str
+    key: str
+
+def _first_env(*names: str) -> str:
+    """候補名を順に見て最初に値が入っている環境変数を返す（サービスロールキー追加時もここに足すだけ）。
+    どれも未設定なら先頭の名前で KeyError。
+    """
+    for n in names:
+        v = os.environ.get(n)
+        if v:
+            return v
+    raise KeyError(names[0])
+
 try:
-    from dotenv import load_dotenv  # type: ignore
-    load_dotenv()
-except Exception:
-    pass  # 未インストールでもOK。環境変数は別途設定しておくこと
+    # NEXT_PUBLIC_* にもフォールバック（フロント共有の値を流用）
+    _url = _first_env("SUPABASE_URL", "NEXT_PUBLIC_SUPABASE_URL")
+    _key = _first_env("SUPABASE_KEY", "NEXT_PUBLIC_SUPABASE_KEY")
+except KeyError as e:
+    raise RuntimeError(f"{e.args[0]} が環境変数に設定されていません。(.env も可)") from e
 
-# NEXT_PUBLIC_* にもフォールバック（フロント共有の値を流用）
-SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY") or os.getenv("NEXT_PUBLIC_SUPABASE_KEY")
+CFG = _Config(_url, _key)
+del _url, _key
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("SUPABASE_URL / SUPABASE_KEY が環境変数に設定されていません。(.env も可)")
+# PostgREST接続プールの上限（無制限だとSupavisorのクライアント枠を食い潰すため抑える）
+_HTTPX_LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=30)
+_HTTPX_TIMEOUT = httpx.Timeout(10.0, connect=2.0)
+
+def _configure_postgrest_pool(client) -> None:
+    """PostgRESTのhttpxセッションを上限付きプールに差し替え（SDK差異を考慮してbest-effort）
+    同期/非同期どちらのクライアントにも適用できるよう、元のセッションと同じ型で作り直す。
+    """
+    try:
+        pg = client.postgrest
+        old = pg.session
+        pg.session = type(old)(
+            base_url=old.base_url,
+            headers=old.headers,
+            limits=_HTTPX_LIMITS,
+            timeout=_HTTPX_TIMEOUT,
+            http2=True,  # h2導入済み。1コネクション上で多重化できる
+        )
+        if isinstance(old, httpx.Client):
+            old.close()  # AsyncClientのcloseはコルーチンなのでGCに任せる
+    except Exception:
+        pass
 
 # 匿名クライアント（RLS非通過の読み取りなどに使用）
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# import時には作らず、初回アクセスで遅延構築する（PEP 562）。
+# モジュールをimportするだけのプロセス（テスト収集やCLI）が
+# SSLコンテキスト構築とhttpxプール初期化を踏まずに済む。
+_supabase: Optional[Client] = None
+
+def _get_supabase() -> Client:
+    global _supabase
+    if _supabase is None:
+        _supabase = create_client(CFG.url, CFG.key)
+        _configure_postgrest_pool(_supabase)
+    return _supabase
 
+def __getattr__(name: str):
+    if name == "supabase":
+        return _get_supabase()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@lru_cache(maxsize=1024)
 def supabase_as(access_token: str) -> Client:
     """
     指定したユーザーJWTでRLSを通すためのクライアントを作成。
     - PostgREST: auth(token)
     - Storage/Realtime: 可能であればAuthorizationヘッダ等を付与（SDK差異を考慮してbest-effort）
+    同じトークンならクライアントを使い回す（毎回の生成はhttpxセッション構築が重い）。
+    JWTは期限切れで自然に使われなくなるため、LRUから順次追い出される。
     """
-    client: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    client: Client = create_client(CFG.url, CFG.key)
+    _configure_postgrest_pool(client)
+    # ヘッダ文字列は構築時に1回だけ組み立てて各サブシステムで使い回す
+    bearer = f"Bearer {access_token}"
     # PostgREST (必須)
     try:
         client.postgrest.auth(access_token)
@@ -37,7 +109,7 @@ def supabase_as(access_token: str) -> Client:
     try:
         # 型や実装差異に備えて best-effort に設定
         if hasattr(client, "storage") and hasattr(client.storage, "client") and hasattr(client.storage.client, "headers"):
-            client.storage.client.headers.update({"Authorization": f"Bearer {access_token}"})
+            client.storage.client.headers["Authorization"] = bearer
     except Exception:
         pass
 
@@ -48,4 +120,78 @@ def supabase_as(access_token: str) -> Client:
     except Exception:
         pass
 
-    return client
\ No newline at end of file
+    return client
+
+# ===== Async クライアント =====
+# ルートハンドラを async def 化してもスレッドプールを使わずに済むよう、
+# 非同期版クライアントを用意する（同期版と同じキャッシュ方針）。
+_supabase_async: Optional[AsyncClient] = None
+
+async def get_supabase_async() -> AsyncClient:
+    """非同期版の匿名クライアント（プロセス内シングルトン）"""
+    global _supabase_async
+    if _supabase_async is None:
+        _supabase_async = await acreate_client(CFG.url, CFG.key)
+        _configure_postgrest_pool(_supabase_async)
+    return _supabase_async
+
+_ASYNC_TOKEN_CACHE_MAX = 1024
+_async_token_clients: "OrderedDict[str, AsyncClient]" = OrderedDict()
+
+async def supabase_as_async(access_token: str) -> AsyncClient:
+    """
+    supabase_as の非同期版。トークンごとにクライアントをLRUで使い回す。
+    Realtime は非同期SDKでは set_auth がコルーチンのため、ここでは扱わない
+    （本バックエンドは PostgREST / Storage のみ使用）。
+    """
+    client = _async_token_clients.get(access_token)
+    if client is not None:
+        _async_token_clients.move_to_end(access_token)
+        return client
+
+    client = await acreate_client(CFG.url, CFG.key)
+    _configure_postgrest_pool(client)
+    bearer = f"Bearer {access_token}"
+    try:
+        client.postgrest.auth(access_token)
+    except Exception:
+        pass
+    try:
+        if hasattr(client, "storage") and hasattr(client.storage, "client") and hasattr(client.storage.client, "headers"):
+            client.storage.client.headers["Authorization"] = bearer
+    except Exception:
+        pass
+
+    _async_token_clients[access_token] = client
+    if len(_async_token_clients) > _ASYNC_TOKEN_CACHE_MAX:
+        _async_token_clients.popitem(last=False)
+    return client
+
+# ===== fork 安全性 =====
+# uvicorn --workers 等のfork後、親のhttpxソケットを子が共有すると壊れる。
+# 子プロセス側ではキャッシュを全て捨て、初回リクエストで作り直させる。
+def _reset_after_fork() -> None:
+    global _supabase, _supabase_async
+    _supabase = None
+    _supabase_async = None
+    supabase_as.cache_clear()
+    _async_token_clients.clear()
+
+if hasattr(os, "register_at_fork"):  # Windowsには無い
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+async def aclose_async_clients() -> None:
+    """プロセス終了時にプール済みAsyncClientのHTTPセッションを明示的に閉じる
+    （GC任せだと "Unclosed client session" 警告やコネクションリークになる）。
+    """
+    global _supabase_async
+    clients = list(_async_token_clients.values())
+    _async_token_clients.clear()
+    if _supabase_async is not None:
+        clients.append(_supabase_async)
+        _supabase_async = None
+    for client in clients:
+        try:
+            await client.postgrest.session.aclose()
+        except Exception:
+            pass